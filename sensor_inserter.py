@@ -5,22 +5,30 @@ sensor_inserter.py
 Insere dados na tabela `sensorsdata` a cada 4 segundos.
 Possui uma probabilidade configurável para gerar leituras totalmente aleatórias.
 Caso a leitura não seja aleatória, os valores serão variações pequenas das leituras anteriores.
+As leituras são acumuladas em lotes e enviadas num único INSERT com várias linhas
+em VALUES (ver `BATCH_SIZE` e `FLUSH_SECONDS`); vários lotes são agrupados na mesma
+transação antes do `commit` (ver `COMMIT_ROWS` e `COMMIT_SECONDS`).
+Com os valores padrão cada leitura fica visível no banco (e no Grafana) em até
+~FLUSH_SECONDS + INTERVAL_SECONDS (cerca de 14 s).
 
 Dependências:
-    pip install mysql-connector-python
+    pip install mysql-connector-python numpy
 
 Configurar as credenciais do banco no dicionário `DB_CONFIG`.
 """
 
 import time
-import random
 import logging
 import signal
+import threading
 from datetime import datetime
-from typing import Dict, Tuple, Optional
+from functools import lru_cache
+from itertools import chain
+from typing import List, Tuple, Optional
 
-import mysql.connector
+import numpy as np
 from mysql.connector import Error
+from mysql.connector.pooling import MySQLConnectionPool
 
 # ================== CONFIGURAÇÃO ==================
 DB_CONFIG = {
@@ -29,156 +37,184 @@ DB_CONFIG = {
     "password": "",
     "database": "soil_sensors",
     "port": 3306,
+    "compress": False,  # True comprime o protocolo (zlib); vale a pena com servidor remoto
 }
 
 SENSOR_NAMES = ["Sensor-01"]  # lista de sensores
 INTERVAL_SECONDS = 4  # intervalo entre inserts
 RANDOM_PROBABILITY = 0.25  # probabilidade de gerar leitura totalmente aleatória
+BATCH_SIZE = 50  # envia o lote ao atingir este número de leituras
+# ou quando passar este tempo desde o último envio; com os valores padrão uma leitura
+# leva no máximo ~FLUSH_SECONDS + INTERVAL_SECONDS para chegar ao banco
+FLUSH_SECONDS = 10
+COMMIT_ROWS = 200  # faz commit ao acumular este número de linhas na transação
+# ou quando a transação estiver aberta há este tempo; mantido <= FLUSH_SECONDS para que
+# todo envio por tempo já faça commit (só lotes cheios por BATCH_SIZE são agrupados)
+COMMIT_SECONDS = 10
+JOURNAL_MAX_ROWS = 1000  # linhas guardadas para reenvio enquanto o banco estiver fora
+POOL_SIZE = 2  # conexões mantidas abertas no pool
+LOG_LEVEL = logging.INFO  # logging.WARNING omite o log de cada linha inserida
 # ==================================================
 
+READINGS_TABLE = "sensor_readings"
+READING_COLUMNS = (
+    "sensor_name",
+    "recorded_at",
+    "latitude",
+    "longitude",
+    "moisture",
+    "temperature",
+    "ph",
+    "ec",
+    "nitrogen",
+    "phosphorus",
+    "potassium",
+)
+INSERT_LOG_FMT = (
+    "INSERT sensor=%s at=%s lat=%s lon=%s moisture=%s temp=%s "
+    "pH=%s EC=%s N=%s P=%s K=%s"
+)
+
+# Faixas plausíveis e casas decimais de cada grandeza, na ordem
+# (latitude, longitude, moisture, temperature, ph, ec, nitrogen, phosphorus, potassium)
+RANDOM_LOW = np.array([-90.0, -180.0, 0.0, -10.0, 0.0, 0.0, 0.0, 0.0, 0.0])
+RANDOM_HIGH = np.array([90.0, 180.0, 100.0, 50.0, 14.0, 5.0, 100.0, 100.0, 200.0])
+READING_SCALE = 10.0 ** np.array([7, 7, 2, 2, 2, 3, 3, 3, 3])
+# Desvio das variações gaussianas entre leituras e limites físicos após a variação
+VARY_SIGMA = np.array([0.00001, 0.00001, 0.5, 0.15, 0.02, 0.01, 0.05, 0.03, 0.1])
+VARY_LOW = np.array([-np.inf, -np.inf, 0.0, -np.inf, 0.0, 0.0, 0.0, 0.0, 0.0])
+VARY_HIGH = np.array(
+    [np.inf, np.inf, 100.0, np.inf, 14.0, np.inf, np.inf, np.inf, np.inf]
+)
+
+rng = np.random.default_rng()
+
 logging.basicConfig(
-    level=logging.INFO,
+    level=LOG_LEVEL,
     format="%(asctime)s %(levelname)s: %(message)s",
     datefmt="%Y-%m-%d %H:%M:%S",
 )
+logger = logging.getLogger(__name__)
 
-stop_requested = False
+stop_requested = threading.Event()
+pool: Optional[MySQLConnectionPool] = None
 
 
 def connect_db():
-    """Tenta conectar ao MySQL e retorna a conexão (ou None em falha)."""
+    """
+    Obtém uma conexão do pool (criado na primeira chamada) e a retorna (ou None em falha).
+    `conn.close()` devolve a conexão ao pool em vez de encerrá-la.
+    """
+    global pool
+    try:
+        if pool is None:
+            pool = MySQLConnectionPool(
+                pool_name="sensors",
+                pool_size=POOL_SIZE,
+                pool_reset_session=False,
+                **DB_CONFIG,
+            )
+            logger.info("Conectado ao banco de dados")
+        return pool.get_connection()
+    except Error as e:
+        logger.error("Erro ao conectar ao banco: %s", e)
+    return None
+
+
+def open_cursor(conn):
+    """
+    Abre o cursor preparado (protocolo binário) reutilizado enquanto a conexão durar:
+    o INSERT é preparado no servidor uma vez por tamanho de lote e os floats vão sem texto.
+    Funciona tanto com a extensão C quanto com o conector em Python puro; este só
+    prepara de novo quando o SQL muda, e build_multi_insert devolve a mesma string
+    (cacheada) para cada tamanho de lote.
+    Retorna o cursor (ou None em falha).
+    """
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        if conn.is_connected():
-            logging.info("Conectado ao banco de dados")
-            return conn
+        return conn.cursor(prepared=True)
     except Error as e:
-        logging.error(f"Erro ao conectar ao banco: {e}")
+        logger.error("Erro ao abrir cursor: %s", e)
     return None
 
 
+def release_db(conn, cur):
+    """Fecha o cursor e devolve a conexão ao pool, ignorando erros de conexão já caída."""
+    try:
+        if cur:
+            cur.close()
+    except Exception:
+        pass
+    try:
+        if conn:
+            conn.close()
+    except Exception:
+        pass
+
+
 def now_str():
     """Timestamp formatado para inserção (YYYY-MM-DD HH:MM:SS)."""
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
 
-def generate_random_reading():
+def round_readings(out: np.ndarray) -> np.ndarray:
+    """Arredonda cada coluna às suas casas decimais (READING_SCALE), no próprio array."""
+    out *= READING_SCALE
+    np.round(out, out=out)
+    out /= READING_SCALE
+    return out
+
+
+def generate_random_readings(n: int) -> np.ndarray:
     """
-    Gera leitura totalmente aleatória com intervalos plausíveis.
-    Retorna tuple: (latitude, longitude, moisture, temperature, ph, ec, nitrogen, phosphorus, potassium)
+    Gera `n` leituras totalmente aleatórias de uma vez, com intervalos plausíveis.
+    Retorna array (n, 9): (latitude, longitude, moisture, temperature, ph, ec, nitrogen, phosphorus, potassium)
+    Unidades: moisture em %, temperature em °C, EC em dS/m, N/P/K em unidade arbitrária.
     """
-    latitude = round(random.uniform(-90.0, 90.0), 7)
-    longitude = round(random.uniform(-180.0, 180.0), 7)
-    moisture = round(random.uniform(0.0, 100.0), 2)  # %
-    temperature = round(random.uniform(-10.0, 50.0), 2)  # °C
-    ph = round(random.uniform(0.0, 14.0), 2)  # pH
-    ec = round(random.uniform(0.0, 5.0), 3)  # dS/m
-    nitrogen = round(random.uniform(0.0, 100.0), 3)  # unidade arbitrária
-    phosphorus = round(random.uniform(0.0, 100.0), 3)
-    potassium = round(random.uniform(0.0, 200.0), 3)
-    return (
-        latitude,
-        longitude,
-        moisture,
-        temperature,
-        ph,
-        ec,
-        nitrogen,
-        phosphorus,
-        potassium,
-    )
+    out = rng.uniform(RANDOM_LOW, RANDOM_HIGH, size=(n, RANDOM_LOW.size))
+    return round_readings(out)
 
 
-def vary_reading(prev: Tuple[float, ...]) -> Tuple[float, ...]:
+def vary_readings(prev: np.ndarray) -> np.ndarray:
     """
-    Gera nova leitura a partir da anterior aplicando pequenas variações gaussianas.
-    prev: (latitude, longitude, moisture, temperature, ph, ec, nitrogen, phosphorus, potassium)
+    Gera novas leituras a partir das anteriores aplicando pequenas variações gaussianas.
+    prev: array (n, 9) na mesma ordem de generate_random_readings; retorna array (n, 9).
     """
-    (
-        lat_prev,
-        lon_prev,
-        moisture_prev,
-        temp_prev,
-        ph_prev,
-        ec_prev,
-        n_prev,
-        p_prev,
-        k_prev,
-    ) = prev
-
-    latitude = round(lat_prev + random.gauss(0, 0.00001), 7)
-    longitude = round(lon_prev + random.gauss(0, 0.00001), 7)
-
-    moisture = round(max(0.0, min(100.0, moisture_prev + random.gauss(0, 0.5))), 2)
-    temperature = round(temp_prev + random.gauss(0, 0.15), 2)
-    ph = round(max(0.0, min(14.0, ph_prev + random.gauss(0, 0.02))), 2)
-    ec = round(max(0.0, ec_prev + random.gauss(0, 0.01)), 3)
-    nitrogen = round(max(0.0, n_prev + random.gauss(0, 0.05)), 3)
-    phosphorus = round(max(0.0, p_prev + random.gauss(0, 0.03)), 3)
-    potassium = round(max(0.0, k_prev + random.gauss(0, 0.1)), 3)
+    out = rng.standard_normal(prev.shape)
+    out *= VARY_SIGMA
+    out += prev
+    np.clip(out, VARY_LOW, VARY_HIGH, out=out)
+    return round_readings(out)
+
 
+@lru_cache(maxsize=16)
+def build_multi_insert(table: str, columns: Tuple[str, ...], n: int) -> str:
+    """
+    Monta um INSERT com `n` grupos de VALUES: INSERT ... VALUES (%s, ...), (%s, ...), ...
+    O SQL fica em cache por tamanho de lote, então a concatenação só é feita uma vez.
+    """
+    row = "(" + ", ".join(["%s"] * len(columns)) + ")"
     return (
-        latitude,
-        longitude,
-        moisture,
-        temperature,
-        ph,
-        ec,
-        nitrogen,
-        phosphorus,
-        potassium,
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+        + ", ".join([row] * n)
     )
 
 
-def insert_reading(
-    conn,
-    sensor_name: str,
-    recorded_at: str,
-    latitude: float,
-    longitude: float,
-    moisture: float,
-    temperature: float,
-    ph: float,
-    ec: float,
-    nitrogen: float,
-    phosphorus: float,
-    potassium: float,
-) -> bool:
-    """
-    Executa o INSERT na tabela sensor_readings.
-    Retorna True se inseriu com sucesso, False caso contrário.
+def insert_readings(conn, cur, rows: List[Tuple], commit: bool) -> bool:
     """
-    sql = """
-        INSERT INTO sensor_readings (
-            sensor_name, recorded_at, latitude, longitude,
-            moisture, temperature, ph, ec, nitrogen, phosphorus, potassium
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    Executa o INSERT em lote na tabela sensor_readings (um único statement) dentro da
+    transação aberta; com `commit=True` confirma a transação em seguida.
+    Cada linha segue a ordem de READING_COLUMNS.
+    Retorna True se inseriu com sucesso, False caso contrário (a transação é desfeita).
     """
-    values = (
-        sensor_name,
-        recorded_at,
-        latitude,
-        longitude,
-        moisture,
-        temperature,
-        ph,
-        ec,
-        nitrogen,
-        phosphorus,
-        potassium,
-    )
     try:
-        cur = conn.cursor()
-        cur.execute(sql, values)
-        conn.commit()
-        cur.close()
-        logging.info(
-            f"INSERT sensor={sensor_name} at={recorded_at} lat={latitude} lon={longitude} "
-            f"moisture={moisture} temp={temperature} pH={ph} EC={ec} N={nitrogen} P={phosphorus} K={potassium}"
-        )
+        if rows:
+            sql = build_multi_insert(READINGS_TABLE, READING_COLUMNS, len(rows))
+            cur.execute(sql, list(chain.from_iterable(rows)))
+        if commit:
+            conn.commit()
         return True
     except Error as e:
-        logging.error(f"Erro no INSERT: {e}")
+        logger.error("Erro no INSERT: %s", e)
         try:
             conn.rollback()
         except Exception:
@@ -186,90 +222,140 @@ def insert_reading(
         return False
 
 
+def drain_pending(blocks: List[np.ndarray], stamps: List[str]) -> List[Tuple]:
+    """
+    Converte o buffer colunar (um array (n_sensores, 9) por ciclo + o timestamp do ciclo)
+    nas linhas do INSERT, na ordem de READING_COLUMNS, e esvazia o buffer.
+    Os valores só viram objetos Python aqui, na fronteira com o driver.
+    """
+    if not blocks:
+        return []
+    readings = np.vstack(blocks).tolist()
+    stamps_per_row = [stamp for stamp in stamps for _ in SENSOR_NAMES]
+    rows = [
+        (sensor, stamp, *reading)
+        for sensor, stamp, reading in zip(
+            SENSOR_NAMES * len(blocks), stamps_per_row, readings
+        )
+    ]
+    blocks.clear()
+    stamps.clear()
+    return rows
+
+
+def flush_batch(conn, cur, batch: List[Tuple], journal: List[Tuple], commit: bool):
+    """
+    Envia o lote pendente e o move para `journal` (linhas enviadas na transação aberta,
+    ainda sem commit). Com `commit=True` confirma a transação, registra no log as linhas
+    confirmadas e esvazia o `journal`.
+    Se falhar (ou não houver conexão), a transação é desfeita: devolve a conexão ao pool,
+    pega outra (com novo cursor) e reenvia o `journal` inteiro uma vez. Se o reenvio
+    também falhar, o `journal` é mantido (até JOURNAL_MAX_ROWS linhas, descartando as
+    mais antigas) para ser reenviado no próximo envio, já numa nova conexão.
+    Retorna (conexão, cursor) em uso (possivelmente novos, ou None após falha).
+    """
+    ok = cur is not None and insert_readings(conn, cur, batch, commit)
+    journal.extend(batch)
+    batch.clear()
+    if not ok:
+        release_db(conn, cur)
+        conn = connect_db()
+        cur = open_cursor(conn) if conn else None
+        ok = cur is not None and insert_readings(conn, cur, journal, commit)
+    if not ok:
+        # a transação foi desfeita: o próximo envio reconecta e reenvia o journal inteiro
+        release_db(conn, cur)
+        conn = cur = None
+        excess = len(journal) - JOURNAL_MAX_ROWS
+        if excess > 0:
+            del journal[:excess]
+            logger.error(
+                "Banco indisponível: %d leituras mais antigas descartadas", excess
+            )
+        logger.warning("%d leituras aguardando reenvio", len(journal))
+    elif commit:
+        # só registra linhas efetivamente confirmadas, cada uma uma única vez;
+        # a mensagem só é montada se o nível INFO estiver habilitado
+        if logger.isEnabledFor(logging.INFO):
+            for row in journal:
+                logger.info(INSERT_LOG_FMT, *row)
+        journal.clear()
+    return conn, cur
+
+
 def handle_shutdown(signum, frame):
-    global stop_requested
-    logging.info("Sinal de término recebido, finalizando...")
-    stop_requested = True
+    logger.info("Sinal de término recebido, finalizando...")
+    stop_requested.set()
 
 
 def main():
-    global stop_requested
     signal.signal(signal.SIGINT, handle_shutdown)
     signal.signal(signal.SIGTERM, handle_shutdown)
 
     conn = connect_db()
     if conn is None:
-        logging.error("Não foi possível conectar ao banco. Saindo.")
+        logger.error("Não foi possível conectar ao banco. Saindo.")
         return
+    cur = open_cursor(conn)
 
-    # Guarda a última leitura por sensor
-    last_readings: Dict[str, Tuple[float, ...]] = {}
-    for s in SENSOR_NAMES:
-        last_readings[s] = generate_random_reading()
+    # Guarda a última leitura por sensor (uma linha por sensor, na ordem de SENSOR_NAMES)
+    last_readings = generate_random_readings(len(SENSOR_NAMES))
+
+    # Leituras aguardando envio ao banco, um array por ciclo (e o timestamp do ciclo)
+    pending: List[np.ndarray] = []
+    pending_at: List[str] = []
+    # Linhas já enviadas mas ainda sem commit
+    journal: List[Tuple] = []
+    last_flush = last_commit = next_tick = time.monotonic()
 
     try:
-        while not stop_requested:
-            for sensor in SENSOR_NAMES:
-                if random.random() < RANDOM_PROBABILITY:
-                    # leitura totalmente aleatória
-                    lat, lon, moisture, temp, ph, ec, n, p, k = (
-                        generate_random_reading()
-                    )
-                else:
-                    # pequena variação a partir da última leitura desse sensor
-                    lat, lon, moisture, temp, ph, ec, n, p, k = vary_reading(
-                        last_readings[sensor]
-                    )
-
-                recorded_at = now_str()
-
-                # tenta inserir; se falhar por conexão, tenta reconectar e reenviar uma vez
-                success = insert_reading(
-                    conn, sensor, recorded_at, lat, lon, moisture, temp, ph, ec, n, p, k
+        while not stop_requested.is_set():
+            # todos os sensores de uma vez: com probabilidade RANDOM_PROBABILITY a leitura
+            # é totalmente aleatória, senão é uma pequena variação da última desse sensor
+            is_random = rng.random(len(SENSOR_NAMES)) < RANDOM_PROBABILITY
+            last_readings = np.where(
+                is_random[:, None],
+                generate_random_readings(len(SENSOR_NAMES)),
+                vary_readings(last_readings),
+            )
+
+            pending.append(last_readings)
+            pending_at.append(now_str())
+
+            # envia o lote quando cheio ou quando já esperou FLUSH_SECONDS
+            now = time.monotonic()
+            pending_rows = len(pending) * len(SENSOR_NAMES)
+            if pending_rows >= BATCH_SIZE or now - last_flush >= FLUSH_SECONDS:
+                batch = drain_pending(pending, pending_at)
+                commit = (
+                    len(journal) + len(batch) >= COMMIT_ROWS
+                    or now - last_commit >= COMMIT_SECONDS
                 )
-                if not success:
-                    # tenta reconectar e reenviar uma vez
-                    try:
-                        if conn.is_connected():
-                            conn.close()
-                    except Exception:
-                        pass
-                    conn = connect_db()
-                    if conn:
-                        insert_reading(
-                            conn,
-                            sensor,
-                            recorded_at,
-                            lat,
-                            lon,
-                            moisture,
-                            temp,
-                            ph,
-                            ec,
-                            n,
-                            p,
-                            k,
-                        )
-
-                last_readings[sensor] = (lat, lon, moisture, temp, ph, ec, n, p, k)
-
-                # interrompe cedo se solicitado
-                if stop_requested:
-                    break
-
-            # espera INTERVAL_SECONDS segundos (pequeno intervalo entre sensores não adicionado; o loop total faz ~INTERVAL_SECONDS)
-            for _ in range(int(INTERVAL_SECONDS * 10)):
-                if stop_requested:
-                    break
-                time.sleep(0.1)
+                conn, cur = flush_batch(conn, cur, batch, journal, commit)
+                last_flush = time.monotonic()
+                if commit:
+                    last_commit = last_flush
+
+            # espera até o próximo ciclo: o prazo avança INTERVAL_SECONDS a cada volta, então
+            # o tempo gasto gerando/inserindo não acumula atraso (se atrasou, não compensa em rajada)
+            # o sinal de término acorda a espera na hora, sem polling
+            next_tick = max(next_tick + INTERVAL_SECONDS, time.monotonic())
+            if stop_requested.wait(next_tick - time.monotonic()):
+                break
 
     finally:
-        try:
-            if conn and conn.is_connected():
-                conn.close()
-                logging.info("Conexão com banco fechada.")
-        except Exception:
-            pass
+        # não perde as leituras ainda no buffer ou na transação ao finalizar
+        batch = drain_pending(pending, pending_at)
+        if batch or journal:
+            conn, cur = flush_batch(conn, cur, batch, journal, commit=True)
+            if journal:
+                logger.error(
+                    "Banco indisponível ao finalizar: %d leituras descartadas",
+                    len(journal),
+                )
+        if conn:
+            release_db(conn, cur)
+            logger.info("Conexão devolvida ao pool.")
 
 
 if __name__ == "__main__":